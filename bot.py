@@ -3,19 +3,24 @@ Telegram Bot for Arbitrage Trades
 Listens to Redis pub/sub for arbitrage trade executions and summaries and sends them to subscribed users.
 """
 
-import json
 import logging
 import asyncio
 import os
-from typing import Set, Dict
+from collections import OrderedDict
+from typing import Set, Dict, FrozenSet, List, Callable
 from dotenv import load_dotenv
+import orjson
 import redis.asyncio as redis
+from redis.backoff import EqualJitterBackoff
 from telegram import Update
+from telegram.error import BadRequest, Forbidden
 from telegram.ext import (
+    AIORateLimiter,
     Application,
     CommandHandler,
     ContextTypes,
 )
+from telegram.request import HTTPXRequest
 
 # Load environment variables
 load_dotenv()
@@ -30,30 +35,66 @@ logger = logging.getLogger(__name__)
 # Store subscribed chat IDs
 subscribed_chats: Set[int] = set()
 
-# Store the last messages to avoid duplicates (per channel)
-last_messages: Dict[str, dict] = {
-    'arbitrage-trade-execution': {},
-    'arbitrage-trade-summary': {}
-}
+# Immutable copy of the subscribed chats, rebuilt on every change and read by broadcasts
+subscribers_snapshot: FrozenSet[int] = frozenset()
+
+# Number of recent message fingerprints remembered per channel for duplicate filtering
+DEDUP_WINDOW = 10_000
+
+# Store fingerprints of recent messages to avoid duplicates (per channel, created on first message)
+recent_messages: Dict[bytes, OrderedDict] = {}
 
 # Redis configuration
 REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
 REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
 REDIS_DB = int(os.getenv('REDIS_DB', 0))
 
+# Shared Redis connection pool, reused across listener reconnects
+redis_pool = redis.ConnectionPool(
+    host=REDIS_HOST,
+    port=REDIS_PORT,
+    db=REDIS_DB,
+    max_connections=4
+)
+
+# Jittered exponential backoff between listener reconnects, so that bot
+# instances don't reconnect in lockstep after a Redis outage
+reconnect_backoff = EqualJitterBackoff(cap=30, base=0.5)
+
+# Upper bound on the failure count fed to the backoff; the delay already hits its
+# cap well before this, and larger exponents overflow when converted to float
+RECONNECT_BACKOFF_MAX_FAILURES = 16
+
 # Redis channels to subscribe to
 REDIS_CHANNELS = ['arbitrage-trade-execution', 'arbitrage-trade-summary']
 
+# Maximum number of Telegram messages in flight during a broadcast.
+# This only bounds concurrency; the send rate is limited by the Application's rate limiter.
+TELEGRAM_SEND_CONCURRENCY = 25
+
+# Number of times a send is retried after Telegram answers with RetryAfter (429)
+TELEGRAM_MAX_RETRIES = 3
+
+# Number of pooled HTTP connections to the Telegram Bot API
+TELEGRAM_CONNECTION_POOL_SIZE = 64
+
 # Telegram Bot Token
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 if not BOT_TOKEN:
     raise ValueError("BOT_TOKEN not found in environment variables. Please set it in .env file")
 
 
+def refresh_subscribers_snapshot() -> None:
+    """Rebuild the broadcast snapshot after the subscribed chats change"""
+    global subscribers_snapshot
+    subscribers_snapshot = frozenset(subscribed_chats)
+
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle the /start command"""
     chat_id = update.effective_chat.id
     subscribed_chats.add(chat_id)
+    refresh_subscribers_snapshot()
     
     await update.message.reply_text(
         '🤖 Welcome to Arbitrage Trade Alerts Bot!\n\n'
@@ -72,6 +113,7 @@ async def stop(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     
     if chat_id in subscribed_chats:
         subscribed_chats.remove(chat_id)
+        refresh_subscribers_snapshot()
         await update.message.reply_text(
             '👋 You have been unsubscribed from arbitrage alerts.\n'
             'Use /start to subscribe again.'
@@ -100,186 +142,229 @@ async def status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         )
 
 
-async def format_trade_message(data: dict, channel: str) -> str:
+def format_trade_execution(data: dict, header: str) -> str:
+    """Format a trade execution into a readable message"""
+    return (
+        header +
+        f"*Exchange:* {data.get('exchange', 'N/A').upper()}\n"
+        f"*Pair:* {data.get('pair', 'N/A').upper()}\n"
+        f"*Side:* {data.get('side', 'N/A').replace('_', ' ').title()}\n"
+        f"*Action:* {data.get('action', 'N/A').upper()}\n"
+        f"*Amount:* {data.get('amount', 0):.2f}\n"
+        f"*Price:* ${data.get('price', 0):.2f}\n"
+        f"*Spread:* {data.get('spread_pct', 0):.2f}%\n"
+        f"*Time:* {data.get('timestamp', 'N/A')}\n"
+    )
+
+
+def format_trade_summary(data: dict, header: str) -> str:
+    """Format a trade summary (from Go publisher with snake_case json tags) into a readable message"""
+    return (
+        header +
+        f"*Pair:* {data.get('pair', 'N/A').upper()}\n"
+        f"*Spot Exchange:* {data.get('spot_exchange', 'N/A').upper()}\n"
+        f"*Futures Exchange:* {data.get('futures_exchange', 'N/A').upper()}\n"
+        f"*Amount:* ${data.get('amount', 0):.2f}\n\n"
+        
+        f"*Entry Spread:* {data.get('entry_spread', 0):.4f}%\n"
+        f"*Exit Spread:* {data.get('exit_spread', 0):.4f}%\n\n"
+        
+        f"*Spot Profit:* ${data.get('spot_profit', 0):.2f}\n"
+        f"*Futures Profit:* ${data.get('futures_profit', 0):.2f}\n"
+        f"*Total Profit:* ${data.get('total_profit', 0):.2f}\n\n"
+        
+        f"*Duration:* {data.get('duration', 'N/A')}\n"
+        f"*Opened:* {data.get('open_time', 'N/A')}\n"
+        f"*Closed:* {data.get('close_time', 'N/A')}\n"
+    )
+
+
+# Icon, title and formatter for each trade channel
+TRADE_FORMAT_SPECS = {
+    b'arbitrage-trade-execution': ("⚡", "*Trade Execution*", format_trade_execution),
+    b'arbitrage-trade-summary': ("📊", "*Trade Summary*", format_trade_summary),
+}
+
+# Icon, message header and formatter for each trade channel, with headers built once
+TRADE_FORMATS = {
+    channel: (icon, f"{icon} {title}\n\n", formatter)
+    for channel, (icon, title, formatter) in TRADE_FORMAT_SPECS.items()
+}
+
+
+def format_trade_message(data: dict, channel: bytes) -> str:
     """Format the trade data into a readable message"""
+    # Unknown channels fall back to the summary format
+    icon, header, formatter = TRADE_FORMATS.get(channel, TRADE_FORMATS[b'arbitrage-trade-summary'])
     try:
-        # Determine message type
-        if 'execution' in channel:
-            icon = "⚡"
-            title = "*Trade Execution*"
-            
-            # Format trade execution
-            exchange = data.get('exchange', 'N/A').upper()
-            pair = data.get('pair', 'N/A').upper()
-            side = data.get('side', 'N/A').replace('_', ' ').title()
-            action = data.get('action', 'N/A').upper()
-            amount = data.get('amount', 0)
-            price = data.get('price', 0)
-            spread = data.get('spread_pct', 0)
-            timestamp = data.get('timestamp', 'N/A')
-            
-            message = f"{icon} {title}\n\n"
-            message += f"*Exchange:* {exchange}\n"
-            message += f"*Pair:* {pair}\n"
-            message += f"*Side:* {side}\n"
-            message += f"*Action:* {action}\n"
-            message += f"*Amount:* {amount:.2f}\n"
-            message += f"*Price:* ${price:.2f}\n"
-            message += f"*Spread:* {spread:.2f}%\n"
-            message += f"*Time:* {timestamp}\n"
-            
-        else:
-            # Trade Summary format (from Go publisher with snake_case json tags)
-            icon = "📊"
-            title = "*Trade Summary*"
-            
-            pair = data.get('pair', 'N/A').upper()
-            spot_exchange = data.get('spot_exchange', 'N/A').upper()
-            futures_exchange = data.get('futures_exchange', 'N/A').upper()
-            entry_spread = data.get('entry_spread', 0)
-            exit_spread = data.get('exit_spread', 0)
-            spot_profit = data.get('spot_profit', 0)
-            futures_profit = data.get('futures_profit', 0)
-            total_profit = data.get('total_profit', 0)
-            amount = data.get('amount', 0)
-            duration = data.get('duration', 'N/A')
-            open_time = data.get('open_time', 'N/A')
-            close_time = data.get('close_time', 'N/A')
-            
-            message = f"{icon} {title}\n\n"
-            message += f"*Pair:* {pair}\n"
-            message += f"*Spot Exchange:* {spot_exchange}\n"
-            message += f"*Futures Exchange:* {futures_exchange}\n"
-            message += f"*Amount:* ${amount:.2f}\n\n"
-            
-            message += f"*Entry Spread:* {entry_spread:.4f}%\n"
-            message += f"*Exit Spread:* {exit_spread:.4f}%\n\n"
-            
-            message += f"*Spot Profit:* ${spot_profit:.2f}\n"
-            message += f"*Futures Profit:* ${futures_profit:.2f}\n"
-            message += f"*Total Profit:* ${total_profit:.2f}\n\n"
-            
-            message += f"*Duration:* {duration}\n"
-            message += f"*Opened:* {open_time}\n"
-            message += f"*Closed:* {close_time}\n"
-            
-            message = f"{icon} {title}\n\n"
-            message += f"*Pair:* {pair}\n"
-            message += f"*Spot Exchange:* {spot_exchange}\n"
-            message += f"*Futures Exchange:* {futures_exchange}\n"
-            message += f"*Amount:* ${amount:.2f}\n\n"
-            
-            message += f"*Entry Spread:* {entry_spread:.4f}%\n"
-            message += f"*Exit Spread:* {exit_spread:.4f}%\n\n"
-            
-            message += f"*Spot Profit:* ${spot_profit:.2f}\n"
-            message += f"*Futures Profit:* ${futures_profit:.2f}\n"
-            message += f"*Total Profit:* ${total_profit:.2f}\n\n"
-            
-            message += f"*Duration:* {duration}\n"
-            message += f"*Opened:* {open_time}\n"
-            message += f"*Closed:* {close_time}\n"
-        
-        return message
+        return formatter(data, header)
     except Exception as e:
         logger.error(f"Error formatting message: {e}")
-        return f"{icon} *New Trade*\n\n```json\n{json.dumps(data, indent=2)}\n```"
+        return f"{icon} *New Trade*\n\n```json\n{orjson.dumps(data, option=orjson.OPT_INDENT_2).decode()}\n```"
+
+
 
+def is_duplicate(channel: bytes, payload: bytes) -> bool:
+    """Check whether the raw payload was already seen recently on the channel and remember it"""
+    fingerprint = hash(payload)
+    seen = recent_messages.get(channel)
+    if seen is None:
+        seen = recent_messages[channel] = OrderedDict()
+    
+    if fingerprint in seen:
+        return True
+    
+    seen[fingerprint] = None
+    if len(seen) > DEDUP_WINDOW:
+        # Forget the oldest fingerprint
+        seen.popitem(last=False)
+    return False
+
+
+def is_chat_unreachable(error: Exception) -> bool:
+    """Check whether a send error means the chat blocked the bot or no longer exists"""
+    if isinstance(error, Forbidden):
+        return True
+    return isinstance(error, BadRequest) and "chat not found" in str(error).lower()
 
 
-async def redis_listener(application: Application) -> None:
-    """Listen to Redis pub/sub channels for arbitrage trades"""
+async def send_to_chat(application: Application, semaphore: asyncio.Semaphore, chat_id: int, payload: dict) -> None:
+    """Send a prepared message payload to a single chat, bounded by the broadcast semaphore"""
+    async with semaphore:
+        await application.bot.send_message(chat_id=chat_id, **payload)
+
+
+async def redis_listener(
+    application: Application,
+    channels: List[str],
+    format_fn: Callable[[dict, bytes], str]
+) -> None:
+    """Listen to the given Redis pub/sub channels and broadcast messages formatted by format_fn"""
     logger.info("Starting Redis listener...")
+    send_semaphore = asyncio.Semaphore(TELEGRAM_SEND_CONCURRENCY)
+    
+    failed_attempts = 0
     
     while True:
+        pubsub = None
         try:
-            # Connect to Redis
-            r = redis.Redis(
-                host=REDIS_HOST,
-                port=REDIS_PORT,
-                db=REDIS_DB,
-                decode_responses=True
-            )
+            # Connect to Redis using the shared pool
+            r = redis.Redis(connection_pool=redis_pool)
             
-            # Subscribe to both channels
-            pubsub = r.pubsub()
-            await pubsub.subscribe(*REDIS_CHANNELS)
-            logger.info(f"Subscribed to Redis channels: {', '.join(REDIS_CHANNELS)}")
+            # Subscribe to all channels on a single connection
+            pubsub = r.pubsub(ignore_subscribe_messages=True)
+            await pubsub.subscribe(*channels)
+            logger.info(f"Subscribed to Redis channels: {', '.join(channels)}")
+            failed_attempts = 0
             
-            # Listen for messages using get_message instead of async iteration
-            while True:
-                try:
-                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
-                    
-                    if message is not None and message['type'] == 'message':
-                        try:
-                            channel = message['channel']
-                            
-                            # Parse the JSON data
-                            data = json.loads(message['data'])
-                            logger.info(f"Received trade from {channel}: {data}")
-                            
-                            # Check if this message is the same as the last one for this channel
-                            if data == last_messages.get(channel, {}):
-                                logger.info(f"Duplicate message on {channel}, skipping...")
-                                continue
-                            
-                            # Update the last message for this channel
-                            last_messages[channel] = data.copy()
-                            
-                            # Format the message
-                            formatted_message = await format_trade_message(data, channel)
-                            
-                            # Send to all subscribed chats
-                            for chat_id in subscribed_chats.copy():
-                                try:
-                                    await application.bot.send_message(
-                                        chat_id=chat_id,
-                                        text=formatted_message,
-                                        parse_mode='Markdown'
-                                    )
-                                    logger.info(f"Sent {channel} message to chat {chat_id}")
-                                except Exception as e:
-                                    logger.error(f"Error sending message to chat {chat_id}: {e}")
-                                    # Remove chat if it's blocked or deleted
-                                    if "bot was blocked" in str(e).lower() or "chat not found" in str(e).lower():
-                                        subscribed_chats.discard(chat_id)
-                                        logger.info(f"Removed chat {chat_id} from subscribers")
+            # Stream messages as they arrive
+            async for message in pubsub.listen():
+                if message['type'] == 'message':
+                    try:
+                        channel = message['channel']
                         
-                        except json.JSONDecodeError as e:
-                            logger.error(f"Error decoding JSON: {e}")
-                        except Exception as e:
-                            logger.error(f"Error processing message: {e}")
-                    
-                    # Small delay to prevent CPU spinning
-                    await asyncio.sleep(0.01)
+                        # Check if this message was already seen recently on this channel
+                        if is_duplicate(channel, message['data']):
+                            logger.info("Duplicate message on %s, skipping...", channel.decode())
+                            continue
+                        
+                        # Parse the JSON data
+                        data = orjson.loads(message['data'])
+                        
+                        # Only pay for per-message log formatting when info logging is on
+                        info_enabled = logger.isEnabledFor(logging.INFO)
+                        if info_enabled:
+                            logger.info("Received trade from %s: %s", channel.decode(), data)
+                        
+                        # Format the message once and share it across all sends
+                        payload = {
+                            'text': format_fn(data, channel),
+                            'parse_mode': 'Markdown'
+                        }
+                        
+                        # Send to all subscribed chats concurrently
+                        chat_ids = subscribers_snapshot
+                        results = await asyncio.gather(
+                            *(send_to_chat(application, send_semaphore, chat_id, payload) for chat_id in chat_ids),
+                            return_exceptions=True
+                        )
+                        
+                        removed_chats = False
+                        for chat_id, result in zip(chat_ids, results):
+                            if isinstance(result, Exception):
+                                logger.error("Error sending message to chat %s: %s", chat_id, result)
+                                # Remove chat if it's blocked or deleted
+                                if is_chat_unreachable(result):
+                                    subscribed_chats.discard(chat_id)
+                                    removed_chats = True
+                                    logger.info("Removed chat %s from subscribers", chat_id)
+                            elif info_enabled:
+                                logger.info("Sent %s message to chat %s", channel.decode(), chat_id)
+                        
+                        # Rebuild the snapshot once for all removed chats
+                        if removed_chats:
+                            refresh_subscribers_snapshot()
                     
-                except asyncio.TimeoutError:
-                    # Timeout is normal, just continue listening
-                    continue
+                    except orjson.JSONDecodeError as e:
+                        logger.error("Error decoding JSON: %s", e)
+                    except Exception as e:
+                        logger.error("Error processing message: %s", e)
             
         except redis.ConnectionError as e:
+            failed_attempts = min(failed_attempts + 1, RECONNECT_BACKOFF_MAX_FAILURES)
+            delay = reconnect_backoff.compute(failed_attempts)
             logger.error(f"Redis connection error: {e}")
-            logger.info("Retrying in 5 seconds...")
-            await asyncio.sleep(5)
+            logger.info(f"Retrying in {delay:.1f} seconds...")
+            await asyncio.sleep(delay)
         except Exception as e:
             logger.error(f"Unexpected error in Redis listener: {e}")
             logger.info("Retrying in 5 seconds...")
             await asyncio.sleep(5)
+        finally:
+            # Release the pubsub connection back to the pool before reconnecting
+            if pubsub is not None:
+                await pubsub.aclose()
 
 
 async def post_init(application: Application) -> None:
     """Initialize the Redis listener after the bot starts"""
-    # Start the Redis listener in the background
-    asyncio.create_task(redis_listener(application))
+    # Start the Redis listener in the background and keep a reference to it
+    application.bot_data['redis_listener'] = asyncio.create_task(
+        redis_listener(application, REDIS_CHANNELS, format_trade_message)
+    )
+
+
+async def post_stop(application: Application) -> None:
+    """Stop the Redis listener when the bot stops"""
+    listener = application.bot_data.pop('redis_listener', None)
+    if listener is not None:
+        listener.cancel()
+        try:
+            await listener
+        except asyncio.CancelledError:
+            pass
 
 
 def main() -> None:
     """Start the bot"""
     logger.info("Starting Arbitrage Bot...")
     
+    # Reuse HTTP/2 connections to the Bot API across concurrent sends
+    request = HTTPXRequest(connection_pool_size=TELEGRAM_CONNECTION_POOL_SIZE, http_version='2')
+    
+    # Keep sends under Telegram's ~30 messages/second limit and retry on RetryAfter
+    rate_limiter = AIORateLimiter(max_retries=TELEGRAM_MAX_RETRIES)
+    
     # Create the Application
-    application = Application.builder().token(BOT_TOKEN).post_init(post_init).build()
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .request(request)
+        .rate_limiter(rate_limiter)
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .build()
+    )
     
     # Add command handlers
     application.add_handler(CommandHandler("start", start))
@@ -3,8 +3,9 @@ Test script to publish arbitrage trades to Redis
 Run this to test the Telegram bot
 """
 
+import argparse
 import redis
-import json
+import orjson
 import time
 from datetime import datetime, timedelta
 
@@ -71,7 +72,7 @@ def publish_trade(channel, trade_data):
     """Publish a trade to Redis"""
     try:
         # Publish to the specified channel
-        r.publish(channel, json.dumps(trade_data))
+        r.publish(channel, orjson.dumps(trade_data))
         print(f"✅ Published to {channel}:")
         
         if channel == 'arbitrage-trade-execution':
@@ -83,18 +84,24 @@ def publish_trade(channel, trade_data):
     except Exception as e:
         print(f"❌ Error publishing: {e}")
 
-def main():
-    print("🧪 Redis Arbitrage Trade Test Publisher")
-    print("=" * 60)
+def publish_burst(repeat):
+    """Publish all test trades in a single pipelined round trip"""
+    pipe = r.pipeline(transaction=False)
+    for _ in range(repeat):
+        for execution in test_executions:
+            pipe.publish('arbitrage-trade-execution', orjson.dumps(execution))
+        for summary in test_summaries:
+            pipe.publish('arbitrage-trade-summary', orjson.dumps(summary))
     
-    # Check Redis connection
     try:
-        r.ping()
-        print("✅ Connected to Redis")
-    except redis.ConnectionError:
-        print("❌ Cannot connect to Redis. Make sure Redis is running on localhost:6379")
-        return
-    
+        pipe.execute()
+        total = repeat * (len(test_executions) + len(test_summaries))
+        print(f"✅ Published {total} trades in one pipeline")
+    except Exception as e:
+        print(f"❌ Error publishing: {e}")
+
+def publish_demo():
+    """Publish test trades one by one with a delay between them"""
     print("\nPublishing test trades...")
     print("=" * 60)
     
@@ -118,5 +125,39 @@ def main():
     print("✅ All test trades published!")
     print("\nCheck your Telegram bot for the messages.")
 
+def positive_int(value):
+    """Parse a command line argument as an integer of at least 1"""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+def main():
+    parser = argparse.ArgumentParser(description="Publish test arbitrage trades to Redis")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--demo', action='store_true', help="publish trades one by one every 2 seconds (default)")
+    mode.add_argument('--burst', action='store_true', help="publish all trades at once in a single pipeline")
+    parser.add_argument('--repeat', type=positive_int, help="number of times to repeat the batch (burst mode only, default: 1)")
+    args = parser.parse_args()
+    
+    if args.repeat is not None and not args.burst:
+        parser.error("--repeat can only be used with --burst")
+    
+    print("🧪 Redis Arbitrage Trade Test Publisher")
+    print("=" * 60)
+    
+    # Check Redis connection
+    try:
+        r.ping()
+        print("✅ Connected to Redis")
+    except redis.ConnectionError:
+        print("❌ Cannot connect to Redis. Make sure Redis is running on localhost:6379")
+        return
+    
+    if args.burst:
+        publish_burst(args.repeat or 1)
+    else:
+        publish_demo()
+
 if __name__ == '__main__':
     main()